@@ -1,33 +1,187 @@
+import asyncio
+import functools
+import html
 import logging
+import re
+from typing import Dict, Optional
 from telegram import Update
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
+from scraper import BookMyShowScraper
 
 logger = logging.getLogger(__name__)
 
+_WELCOME_MSG = (
+    "👋 Hello! I'm your TicketScout bot.\n\n"
+    "I can monitor BookMyShow for movie tickets and notify you when they're available."
+)
+
+_HELP_MSG = (
+    "📖 Available commands:\n"
+    "/start - Start the bot\n"
+    "/help - Show this help message\n"
+    "/status - Show current monitoring status\n"
+    "/add_movie <url> - Add a movie URL to monitor\n"
+    "/test <url> - Check a movie URL right now"
+)
+
+_STATUS_MSG = "✅ Monitoring is running in the background."
+
+_ADD_MOVIE_MSG = "⚠️ Usage: /add_movie <bookmyshow_url>"
+
+# /test result templates (HTML parse mode; values must be html-escaped)
+_TEST_AVAILABLE_TMPL = (
+    "✅ <b>Test Result – TICKETS AVAILABLE!</b>\n\n"
+    "🎬 Movie: {title}\n"
+    "🔗 URL: {url}\n\n"
+    "🎟️ Status: {status}\n\n"
+    "🎉 Great news! Booking appears to be open!"
+)
+
+_TEST_UNAVAILABLE_TMPL = (
+    "❌ <b>Test Result – NOT AVAILABLE YET</b>\n\n"
+    "🎬 Movie: {title}\n"
+    "🔗 URL: {url}\n\n"
+    "🎟️ Status: {status}"
+)
+
+_TEST_FAILED_TMPL = (
+    "⚠️ <b>Test Result – CHECK FAILED</b>\n\n"
+    "🔗 URL: {url}\n\n"
+    "❗ Error: {error}"
+)
+
+_KEYWORDS = {
+    'hello': frozenset({'hello', 'hi', 'hey', 'namaste'}),
+    'bye': frozenset({'bye', 'goodbye', 'see you', 'good night'}),
+}
+
+# Keyword -> category map and a single matcher over every keyword, built once
+# at import so each message is scanned in one pass. Word boundaries keep short
+# keywords like 'hi' from matching inside words ('this', 'Shiva').
+_KEYWORD_CATEGORIES = {
+    word: category for category, words in _KEYWORDS.items() for word in words
+}
+_KEYWORD_RE = re.compile(r'\b(?:' + '|'.join(
+    re.escape(word) for word in sorted(_KEYWORD_CATEGORIES, key=lambda w: (-len(w), w))
+) + r')\b', re.IGNORECASE)
+
+# Detects and extracts a BookMyShow link in one scan. The link never ends in
+# sentence punctuation, so "...ET00436673." or "(...ET00436673)" is cut cleanly.
+_BMS_RE = re.compile(r'https?://\S*bookmyshow\.com(?:\S*[^\s.,;:!?)])?', re.IGNORECASE)
+
+def requires_message(handler):
+    """Skip updates without a message or sender (e.g. edits, channel posts)."""
+    @functools.wraps(handler)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.message is None or update.effective_user is None:
+            return
+        return await handler(self, update, context)
+    return wrapper
+
 class BotHandlers:
+    def __init__(self, scraper: Optional[BookMyShowScraper] = None):
+        self.scraper = scraper or BookMyShowScraper()
+
+        # In-flight check per URL, so concurrent tests of the same page share
+        # a single fetch and its result (including failures).
+        self._test_tasks: Dict[str, asyncio.Task] = {}
+
+    @requires_message
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(
-            "👋 Hello! I'm your TicketScout bot.\n\n"
-            "I can monitor BookMyShow for movie tickets and notify you when they're available."
-        )
+        await update.message.reply_text(_WELCOME_MSG)
 
+    @requires_message
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(
-            "📖 Available commands:\n"
-            "/start - Start the bot\n"
-            "/help - Show this help message\n"
-            "/status - Show current monitoring status\n"
-            "/add_movie <url> - Add a movie URL to monitor\n"
-            "/test - Send a test notification"
-        )
+        await update.message.reply_text(_HELP_MSG)
 
+    @requires_message
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text("✅ Monitoring is running in the background.")
+        await update.message.reply_text(_STATUS_MSG)
 
+    @requires_message
     async def add_movie_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if context.args:
             url = context.args[0]
             # TODO: integrate with BookingMonitor to actually add
             await update.message.reply_text(f"🎬 Added movie URL to monitor:\n{url}")
         else:
-            await update.message.reply_text("⚠️ Usage: /add_movie <bookmyshow_url>")
+            await update.message.reply_text(_ADD_MOVIE_MSG)
+
+    async def _check_coalesced(self, url: str) -> dict:
+        """Check a URL, letting concurrent checks of it share one fetch."""
+        task = self._test_tasks.get(url)
+        if task is None:
+            task = asyncio.create_task(self.scraper.check_ticket_availability(url), name=f'test:{url}')
+            self._test_tasks[url] = task
+            task.add_done_callback(lambda _: self._test_tasks.pop(url, None))
+        # Shielded so one caller giving up doesn't cancel the check for the rest
+        return await asyncio.shield(task)
+
+    @requires_message
+    async def test_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+
+        if not context.args:
+            await update.message.reply_text("⚠️ Usage: /test <bookmyshow_url>")
+            return
+
+        test_url = context.args[0]
+        status_message = await update.message.reply_text(f"🔍 Checking ticket availability...\n{test_url}")
+
+        try:
+            result = await self._check_coalesced(test_url)
+        except Exception:
+            logger.exception("Test command error for user %s", user_id)
+            await status_message.edit_text("❌ Test failed due to an unexpected error.")
+            return
+
+        if result['error']:
+            if '403' in result['error']:
+                reason = "Website blocking automated requests"
+            else:
+                reason = result['error']
+            result_message = _TEST_FAILED_TMPL.format(
+                url=html.escape(test_url), error=html.escape(reason)
+            )
+        else:
+            template = _TEST_AVAILABLE_TMPL if result['available'] else _TEST_UNAVAILABLE_TMPL
+            result_message = template.format(
+                title=html.escape(result['title']),
+                url=html.escape(test_url),
+                status=html.escape(result['status'])
+            )
+
+        await status_message.edit_text(result_message, parse_mode=ParseMode.HTML)
+        logger.info("Sent test result to user %s: %s", user_id, result['status'])
+
+    @requires_message
+    async def echo_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        raw = update.message.text
+        user_id = update.effective_user.id
+
+        # Look for a link first so words inside the URL (e.g. "hindi") are not
+        # mistaken for greetings.
+        url_match = _BMS_RE.search(raw)
+        if url_match is not None:
+            await update.message.reply_text(
+                "🔗 That looks like a BookMyShow link.\n"
+                f"Use /add_movie {url_match.group(0)} to start monitoring it."
+            )
+            logger.info("Replied to message from user %s", user_id)
+            return
+
+        # Match case-insensitively on the original text; only the (short)
+        # matched keyword is lowercased, never the whole message.
+        match = _KEYWORD_RE.search(raw)
+        category = _KEYWORD_CATEGORIES[match.group(0).lower()] if match else None
+
+        if category == 'hello':
+            await update.message.reply_text("👋 Hi there! Send /help to see what I can do.")
+        elif category == 'bye':
+            await update.message.reply_text("👋 Goodbye! I'll keep watching for tickets.")
+        else:
+            await update.message.reply_text(
+                f"💬 You said: {raw}\n\nSend /help to see available commands."
+            )
+        logger.info("Replied to message from user %s", user_id)
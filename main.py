@@ -4,16 +4,30 @@ Main entry point for the Telegram bot that monitors BookMyShow for movie ticket
 This bot provides basic chat functionality and continuous monitoring of movie booking status.
 """
 
+import atexit
 import os
 import logging
-import threading
+import queue
+import secrets
+from logging.handlers import QueueHandler, QueueListener
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from bot_handlers import BotHandlers
 from monitor import BookingMonitor
+from scraper import BookMyShowScraper
 
-# Configure logging
+# Configure logging: records are handed to a background listener thread so
+# the event loop never blocks on stderr writes. No %(asctime)s, since Render
+# and GitHub Actions already timestamp every output line.
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter('%(levelname)s - %(name)s - %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+_log_queue_handler = QueueHandler(_log_queue)
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[_log_queue_handler],
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
@@ -35,14 +49,36 @@ def main():
         logger.warning("TELEGRAM_CHAT_ID not set. Notifications will not be sent.")
 
     try:
-        # Create the Application
-        application = Application.builder().token(bot_token).build()
-        
+        # One scraper (and HTTP session) shared by /test and the monitor, so
+        # connections to BookMyShow are reused instead of re-handshaking
+        scraper = BookMyShowScraper(api_url=os.getenv("BMS_API_URL"))
+
+        async def on_startup(application: Application) -> None:
+            # Optionally accept availability updates pushed by other services
+            push_port = os.getenv("MONITOR_PUSH_PORT")
+            push_secret = os.getenv("MONITOR_PUSH_SECRET")
+            if push_port and push_secret:
+                await booking_monitor.start_push_server(int(push_port), push_secret)
+            elif push_port:
+                logger.warning("MONITOR_PUSH_PORT set without MONITOR_PUSH_SECRET; push endpoint disabled.")
+
+        async def on_shutdown(application: Application) -> None:
+            await booking_monitor.stop()
+            await scraper.close()
+
+        # Create the Application; process up to 32 updates concurrently so a
+        # slow /test for one user does not hold up everyone else's messages
+        application = (
+            Application.builder()
+            .token(bot_token)
+            .concurrent_updates(32)
+            .post_init(on_startup)
+            .post_shutdown(on_shutdown)
+            .build()
+        )
+
         # Initialize bot handlers
-        bot_handlers = BotHandlers()
-        
-        # Initialize booking monitor
-        booking_monitor = BookingMonitor(application.bot, chat_id)
+        bot_handlers = BotHandlers(scraper)
         
         # Register command handlers
         application.add_handler(CommandHandler("start", bot_handlers.start_command))
@@ -54,13 +90,28 @@ def main():
         # Register message handler for text messages
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot_handlers.echo_message))
         
-        # Start the booking monitor (no thread needed in PTB 20+)
-        booking_monitor = BookingMonitor(application, chat_id)
+        # Schedule the booking monitor on the application's job queue
+        booking_monitor = BookingMonitor(application, chat_id, scraper=scraper)
         booking_monitor.start_monitoring()
         
-        # Start the bot with long polling
-        logger.info("Starting Telegram bot...")
-        application.run_polling(allowed_updates=["message"])
+        # Use webhooks when a public URL is configured (e.g. on Render), so
+        # Telegram pushes updates instead of us polling getUpdates; fall back
+        # to long polling for local runs and the scheduled GitHub workflow.
+        webhook_url = os.getenv("WEBHOOK_URL")
+        if webhook_url:
+            secret_path = secrets.token_urlsafe(20)
+            logger.info("Starting Telegram bot with webhook...")
+            application.run_webhook(
+                listen="0.0.0.0",
+                port=int(os.getenv("PORT", "8443")),
+                url_path=secret_path,
+                webhook_url=f"{webhook_url.rstrip('/')}/{secret_path}",
+                secret_token=os.getenv("WEBHOOK_SECRET"),
+                allowed_updates=["message"]
+            )
+        else:
+            logger.info("Starting Telegram bot with long polling...")
+            application.run_polling(allowed_updates=["message"])
         
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
@@ -1,69 +1,299 @@
 import asyncio
+import hmac
 import logging
-import requests
-from bs4 import BeautifulSoup
+import random
+import sqlite3
+import time
+from typing import Dict, List, Optional
+from aiohttp import web
 from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.ext import ContextTypes
+from scraper import BookMyShowScraper
 
 logger = logging.getLogger(__name__)
 
 class BookingMonitor:
-    def __init__(self, application, chat_id: str, interval: int = 60):
+    def __init__(self, application, chat_id: str, min_interval: int = 60,
+                 max_interval: int = 900, backoff_factor: float = 1.5,
+                 scraper: Optional[BookMyShowScraper] = None,
+                 state_path: str = 'monitor_state.db', tick_interval: int = 10):
         """
         Monitors a BookMyShow movie page and notifies a Telegram chat
         when 'Interested' changes to 'Book'.
 
+        Each URL is polled on its own adaptive interval: it starts at
+        min_interval, grows by backoff_factor after every unchanged check
+        (up to max_interval) and drops back to min_interval on a change.
+        The job queue wakes every tick_interval seconds and checks the URLs
+        that are due, so jittered due times are honoured to within one tick.
+
         :param application: PTB Application instance
         :param chat_id: Telegram chat ID to send notifications
-        :param interval: Time between checks (in seconds)
+        :param min_interval: Shortest time between checks of a URL (in seconds)
+        :param max_interval: Longest time between checks of a URL (in seconds)
+        :param backoff_factor: Interval multiplier after an unchanged check
+        :param scraper: Scraper to fetch pages with (shares its HTTP session)
+        :param state_path: SQLite file that keeps each URL's last known state
+            across restarts, so a restart doesn't re-notify
+        :param tick_interval: How often to look for due URLs (in seconds)
         """
         self.application = application
         self.chat_id = chat_id
-        self.interval = interval
-        self.movie_urls = []  # list of movie URLs being tracked
-        self.running = False
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.tick_interval = tick_interval
+        self.scraper = scraper or BookMyShowScraper()
+        self.movie_urls: Dict[str, None] = {}  # tracked movie URLs, in insertion order
+        self.previous_states = {}  # url -> last availability and poll schedule
+
+        # Last known availability per URL, persisted so it survives restarts
+        self._db = sqlite3.connect(state_path, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'url TEXT PRIMARY KEY, available INTEGER, status TEXT, '
+            'etag TEXT, last_modified TEXT, last_check REAL, title TEXT)'
+        )
+        # Databases created before titles were stored lack the column
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(state)')}
+        if 'title' not in columns:
+            self._db.execute('ALTER TABLE state ADD COLUMN title TEXT')
+
+        # Notifications go through a queue drained by a single worker, which
+        # batches bursts into one message and paces sends to stay under
+        # Telegram's per-chat limits
+        self.notify_batch_window = 0.5  # seconds to wait for more results
+        self.notify_min_gap = 1.0  # seconds between messages
+        self._notify_queue: asyncio.Queue = asyncio.Queue()
+        self._notify_task: Optional[asyncio.Task] = None
+
+        # Optional HTTP endpoint for pushed results (see start_push_server)
+        self._push_runner: Optional[web.AppRunner] = None
+        self._push_secret = ''
 
     def add_movie(self, url: str):
         """Add a movie URL to track."""
         if url not in self.movie_urls:
-            self.movie_urls.append(url)
+            self.movie_urls[url] = None
+            # Check new URLs on the next tick, at the shortest interval,
+            # starting from whatever was known before the last restart
+            row = self._db.execute(
+                'SELECT available, etag, last_modified, title FROM state WHERE url = ?', (url,)
+            ).fetchone()
+            available, etag, last_modified, title = row if row else (None, None, None, None)
+            self.previous_states[url] = {
+                'available': None if available is None else bool(available),
+                'etag': etag,
+                'last_modified': last_modified,
+                'title': title,
+                'interval': self.min_interval,
+                'next_check': 0.0
+            }
             logger.info(f"Added movie URL: {url}")
 
+    def remove_movie(self, url: str):
+        """Stop tracking a movie URL."""
+        if url in self.movie_urls:
+            del self.movie_urls[url]
+            self.previous_states.pop(url, None)
+            self._db.execute('DELETE FROM state WHERE url = ?', (url,))
+            logger.info(f"Removed movie URL: {url}")
+
     async def check_movie(self, url: str):
-        """Fetch the page and check if 'Book' button exists."""
+        """Fetch the page, notify if booking just opened and reschedule the URL."""
+        state = self.previous_states[url]
         try:
-            response = requests.get(url, timeout=10)
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            # Example logic: adjust selectors as needed for BookMyShow
-            button = soup.find("button")
-            if button and "Book" in button.get_text():
-                await self.application.bot.send_message(
-                    chat_id=self.chat_id,
-                    text=f"🎉 Tickets are available! Go book now: {url}"
-                )
-                logger.info(f"Booking available for {url}")
-            else:
-                logger.info(f"Still no booking for {url}")
+            # Send the previous validators so an unchanged page comes back as a
+            # bodyless 304 instead of being downloaded and parsed again; skip
+            # the scraper's result cache so a due check always hits the site
+            result = await self.scraper.check_ticket_availability(
+                url, etag=state['etag'], last_modified=state['last_modified'], force=True
+            )
+            changed = self.handle_result(url, result)
         except Exception as e:
+            changed = False
             logger.error(f"Error checking {url}: {e}")
 
-    async def run(self):
-        """Background loop that keeps checking movies."""
-        self.running = True
-        while self.running:
-            if not self.movie_urls:
-                await asyncio.sleep(self.interval)
+        self._reschedule(state, changed)
+
+    def handle_result(self, url: str, result: dict) -> bool:
+        """
+        Record a check result for a tracked URL, whether polled or pushed,
+        and queue a notification if booking just opened.
+
+        :return: True if the URL's availability changed
+        """
+        state = self.previous_states[url]
+        if result['error'] or result['not_modified']:
+            # Nothing new to learn about availability
+            changed = False
+        else:
+            # Keep the last known title when this source didn't name the movie
+            if result['title'] == BookMyShowScraper.UNKNOWN_TITLE and state['title']:
+                result['title'] = state['title']
+            changed = result['available'] != state['available']
+            state['available'] = result['available']
+            state['etag'] = result['etag']
+            state['last_modified'] = result['last_modified']
+            state['title'] = result['title']
+            self._db.execute(
+                'INSERT OR REPLACE INTO state '
+                '(url, available, status, etag, last_modified, last_check, title) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, int(result['available']), result['status'],
+                 result['etag'], result['last_modified'], time.time(), result['title'])
+            )
+
+        if changed and result['available']:
+            logger.info(f"Booking available for {url}")
+            self._queue_notification(result)
+        else:
+            logger.info(f"No new booking for {url}: {result['status']}")
+        return changed
+
+    def _reschedule(self, state: dict, changed: bool):
+        """Set a URL's next check: back to min_interval on change, else back off."""
+        if changed:
+            state['interval'] = self.min_interval
+        else:
+            state['interval'] = min(state['interval'] * self.backoff_factor, self.max_interval)
+        # Jitter keeps URLs from settling into lock-step polling
+        state['next_check'] = time.monotonic() + state['interval'] * random.uniform(0.8, 1.2)
+
+    async def start_push_server(self, port: int, secret: str, host: str = '0.0.0.0',
+                                path: str = '/push'):
+        """
+        Accept availability results pushed over HTTP, so a source that can
+        notify (a third-party watcher, a future BookMyShow integration)
+        doesn't have to wait for the next poll. Pushed results go through the
+        same change detection as polled ones.
+
+        Requests are POSTs to path with a JSON body such as
+        {"url": "...", "available": true, "title": "...", "status": "..."}
+        and the shared secret in the X-TicketScout-Secret header.
+
+        :param port: Port to listen on
+        :param secret: Shared secret callers must send
+        :param host: Interface to listen on
+        :param path: URL path to accept pushes on
+        """
+        self._push_secret = secret
+        app = web.Application()
+        app.router.add_post(path, self._handle_push)
+        self._push_runner = web.AppRunner(app)
+        await self._push_runner.setup()
+        await web.TCPSite(self._push_runner, host, port).start()
+        logger.info(f"Accepting pushed availability updates on port {port}{path}")
+
+    async def _handle_push(self, request: web.Request) -> web.Response:
+        """Handle one pushed availability result."""
+        provided = request.headers.get('X-TicketScout-Secret', '')
+        if not hmac.compare_digest(provided.encode(), self._push_secret.encode()):
+            return web.Response(status=403)
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        if not (isinstance(payload, dict) and isinstance(payload.get('url'), str)
+                and isinstance(payload.get('available'), bool)):
+            return web.Response(status=400, text="Expected JSON with string 'url' and boolean 'available'")
+        url = payload['url']
+        available = payload['available']
+        if url not in self.movie_urls:
+            return web.Response(status=404, text="URL is not being monitored")
+
+        state = self.previous_states[url]
+        result = {
+            'available': available,
+            'status': str(payload.get('status') or "Pushed update"),
+            'error': None,
+            'title': str(payload.get('title') or BookMyShowScraper.UNKNOWN_TITLE),
+            'url': url,
+            # A push says nothing about the page itself, so keep the
+            # validators used for the next conditional GET
+            'etag': state['etag'],
+            'last_modified': state['last_modified'],
+            'not_modified': False
+        }
+        changed = self.handle_result(url, result)
+        self._reschedule(state, changed)
+        return web.Response(status=204)
+
+    def _queue_notification(self, result: dict):
+        """Queue an availability result, starting the notification worker if needed."""
+        if not self.chat_id:
+            return
+        if self._notify_task is None or self._notify_task.done():
+            self._notify_task = asyncio.create_task(self._notify_worker(), name='notify-worker')
+            self._notify_task.add_done_callback(self._on_notify_worker_done)
+        self._notify_queue.put_nowait(result)
+
+    def _on_notify_worker_done(self, task: asyncio.Task):
+        """Log a crashed notification worker; the next queued result restarts it."""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Notification worker stopped unexpectedly", exc_info=task.exception())
+
+    async def _notify_worker(self):
+        """Send queued notifications, batching bursts and pacing messages."""
+        while True:
+            batch = [await self._notify_queue.get()]
+            # Let other URLs that flipped in the same tick join this message
+            await asyncio.sleep(self.notify_batch_window)
+            while not self._notify_queue.empty():
+                batch.append(self._notify_queue.get_nowait())
+
+            started = time.monotonic()
+            try:
+                await self.send_availability_notification(batch)
+            except RetryAfter as e:
+                logger.warning(f"Telegram rate limit hit; retrying notification in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+                for result in batch:
+                    self._notify_queue.put_nowait(result)
                 continue
+            except Exception as e:
+                logger.error(f"Error sending notification: {e}")
+
+            await asyncio.sleep(max(0.0, self.notify_min_gap - (time.monotonic() - started)))
 
-            for url in self.movie_urls:
-                await self.check_movie(url)
+    async def send_availability_notification(self, results: List[dict]):
+        """Tell the configured chat that booking has opened for one or more movies."""
+        if len(results) == 1:
+            result = results[0]
+            text = f"🎉 Tickets are available for {result['title']}! Go book now: {result['url']}"
+        else:
+            lines = [f"🎬 {result['title']}: {result['url']}" for result in results]
+            text = "🎉 Tickets are available! Go book now:\n\n" + "\n".join(lines)
+        await self.application.bot.send_message(chat_id=self.chat_id, text=text)
+        logger.info(f"Sent availability notification for {len(results)} movie(s)")
 
-            await asyncio.sleep(self.interval)
+    async def check_once(self, context: ContextTypes.DEFAULT_TYPE):
+        """Job queue callback that concurrently checks every movie that is due."""
+        now = time.monotonic()
+        due = [url for url in self.movie_urls if self.previous_states[url]['next_check'] <= now]
+        tasks = [asyncio.create_task(self.check_movie(url), name=f'check:{url}') for url in due]
+        # Wait for every check before the tick ends, logging any that failed
+        # instead of letting one failure cancel or hide the others
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        for url, outcome in zip(due, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Check failed for {url}", exc_info=outcome)
 
     def start_monitoring(self):
-        """Schedules the monitor task inside PTB's event loop."""
+        """Schedules checks on PTB's job queue, waking every tick_interval."""
         self.application.job_queue.run_repeating(
-            lambda _: asyncio.create_task(self.run()),
-            interval=self.interval,
+            self.check_once,
+            interval=self.tick_interval,
             first=0
         )
+
+    async def stop(self):
+        """Stop the notification worker and push endpoint, and close the state store."""
+        if self._notify_task is not None:
+            self._notify_task.cancel()
+            await asyncio.gather(self._notify_task, return_exceptions=True)
+        if self._push_runner is not None:
+            await self._push_runner.cleanup()
+        self._db.close()
@@ -1,67 +1,231 @@
 """
 Web scraper module for monitoring BookMyShow movie ticket availability.
-Uses requests and BeautifulSoup to check for 'Book tickets' button availability.
+Uses aiohttp and BeautifulSoup to check for 'Book tickets' button availability.
 """
 
-import requests
+import asyncio
+import aiohttp
 import logging
+import re
+import soupsieve
 import time
-from bs4 import BeautifulSoup
-from typing import Dict, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+from cachetools import TTLCache
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+try:
+    # The Lexbor backend; selectolax 1.0 dropped the Modest one behind
+    # selectolax.parser, and importing it there raises ImportError
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+    _HTML_PARSER_ERROR = None
+except ImportError as e:  # optional; get_movie_info falls back to BeautifulSoup
+    HTMLParser = None
+    _HTML_PARSER_ERROR = e
+
 class BookMyShowScraper:
     """
     Web scraper class for monitoring BookMyShow movie pages for ticket availability.
     """
     
-    def __init__(self):
-        """Initialize the scraper with session and headers."""
-        self.session = requests.Session()
+    # Look for booking availability indicators
+    BOOKING_INDICATORS = [
+        'Book tickets',
+        'Book now',
+        'Buy tickets',
+        'Purchase tickets',
+        'Select seats',
+        'Choose seats'
+    ]
+    
+    # Check for sold out or unavailable indicators
+    UNAVAILABLE_INDICATORS = [
+        'sold out',
+        'not available',
+        'coming soon',
+        'advance booking not started',
+        'no shows available'
+    ]
+    
+    # One precompiled, case-insensitive matcher for both kinds of indicator;
+    # the named group tells them apart. It is run over the raw HTML as a cheap
+    # prefilter, then over the visible page text to confirm a hit
+    INDICATOR_RE = re.compile(
+        '(?P<available>' + '|'.join(map(re.escape, BOOKING_INDICATORS)) + ')'
+        '|(?P<unavailable>' + '|'.join(map(re.escape, UNAVAILABLE_INDICATORS)) + ')',
+        re.IGNORECASE
+    )
+    
+    # Booking indicators alone, for matching button/link text
+    BOOKING_RE = re.compile('|'.join(map(re.escape, BOOKING_INDICATORS)), re.IGNORECASE)
+    
+    # When the raw HTML has no indicator at all, only titles and buttons/links
+    # need checking, so only those elements are built into the parse tree
+    STRAINER = SoupStrainer(['h1', 'button', 'a'])
+    
+    # Elements whose text never shows on the page (matches in <meta> or other
+    # attributes are already dropped by working on parsed text)
+    HIDDEN_TAGS = ['head', 'script', 'style', 'noscript', 'template']
+    
+    # Title candidates in priority order, each compiled once; the page is
+    # walked once and the match for the earliest selector wins, wherever it
+    # appears in the document
+    TITLE_SELECTORS = ('h1[data-testid="movie-title"]', 'h1.movie-title', '.movie-name h1', 'h1', '.title')
+    TITLE_MATCHERS = tuple(soupsieve.compile(selector) for selector in TITLE_SELECTORS)
+    
+    # Event code at the end of a movie URL, e.g. .../ET00436673
+    EVENT_CODE_RE = re.compile(r'/(ET\d+)/?(?:[?#]|$)')
+    
+    # Expected JSON endpoint schema: lists of show/venue objects under keys
+    # containing 'show' or 'venue' (at any depth), each carrying either a
+    # boolean availability flag or a status string, e.g.
+    #   {"venues": [{"name": "...", "showTimes": [{"time": "18:30", "status": "available"}]}]}
+    # Entries without either field are not counted, and lists under
+    # recommendation-like keys are ignored entirely. The movie title is read
+    # from a title-like key on the top-level object or one level below it
+    # (e.g. {"event": {"eventName": "..."}}).
+    API_SHOW_KEY_RE = re.compile(r'show|venue', re.IGNORECASE)
+    API_SKIP_KEY_RE = re.compile(r'recommend|similar|related|suggest', re.IGNORECASE)
+    API_FLAG_KEYS = ('available', 'isAvailable', 'bookable', 'isBookable')
+    API_STATUS_KEYS = ('status', 'availability', 'availStatus')
+    API_AVAILABLE_STATUSES = frozenset({'available', 'bookable', 'open', 'filling fast', 'almost full'})
+    API_TITLE_KEYS = ('title', 'eventTitle', 'eventName', 'movieName')
+    
+    # Title reported when a page or payload doesn't name the movie
+    UNKNOWN_TITLE = 'Unknown Movie'
+    
+    def __init__(self, concurrency: int = 4, cache_ttl: int = 60,
+                 api_url: Optional[str] = None):
+        """
+        Initialize the scraper with session and headers.
+
+        Args:
+            concurrency: Maximum number of page requests in flight at once
+            cache_ttl: Seconds a successful availability result is reused
+            api_url: Optional JSON endpoint template with an {event_code}
+                placeholder; when set it is tried before scraping the HTML page
+                (expected response schema is described at API_SHOW_KEY_RE)
+        """
+        self.api_url = api_url
+        
+        if HTMLParser is None:
+            logger.warning(f"selectolax unavailable ({_HTML_PARSER_ERROR}); "
+                           f"get_movie_info will use BeautifulSoup")
         
         # Set headers to mimic a real browser - updated to latest Chrome
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
             'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'identity',
+            'Accept-Encoding': 'gzip, deflate',
             'DNT': '1',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Site': 'none',
             'Sec-Fetch-Mode': 'navigate',
             'Sec-Fetch-User': '?1',
-            'Sec-Fetch-Dest': 'document',
-            'Cache-Control': 'max-age=0'
+            'Sec-Fetch-Dest': 'document'
         }
-        self.session.headers.update(self.headers)
         
-        # Rate limiting - minimum time between requests
-        self.last_request_time = 0
+        # Shared HTTP session; created lazily because it must be bound to the
+        # running event loop
+        self._client: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        
+        # Recent availability results per URL
+        self._cache = TTLCache(maxsize=256, ttl=cache_ttl)
+        
+        # Rate limiting - minimum time between requests to the same host
         self.min_request_interval = 2  # seconds
+        self._last_request_times: Dict[str, float] = {}
+        self._rate_limit_locks: Dict[str, asyncio.Lock] = {}
     
-    def _rate_limit(self) -> None:
+    async def _rate_limit(self, url: str) -> None:
         """
         Implement rate limiting to avoid overwhelming the server.
-        Ensures minimum interval between requests.
+        Ensures minimum interval between requests to the same host, waiting
+        without blocking the event loop or delaying requests to other hosts.
         """
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
-        
-        if time_since_last_request < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last_request
-            logger.info(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
-            time.sleep(sleep_time)
-        
-        self.last_request_time = time.time()
+        host = urlparse(url).netloc
+        async with self._rate_limit_locks.setdefault(host, asyncio.Lock()):
+            last_request_time = self._last_request_times.get(host)
+            if last_request_time is not None:
+                time_since_last_request = time.monotonic() - last_request_time
+                if time_since_last_request < self.min_request_interval:
+                    sleep_time = self.min_request_interval - time_since_last_request
+                    logger.info(f"Rate limiting {host}: sleeping for {sleep_time:.2f} seconds")
+                    await asyncio.sleep(sleep_time)
+            self._last_request_times[host] = time.monotonic()
+    
+    @staticmethod
+    def _normalize_text(text: str) -> str:
+        """Collapse runs of whitespace (including non-breaking spaces) to one space."""
+        return ' '.join(text.split())
+    
+    def _scan_elements(self, soup: BeautifulSoup) -> Tuple[Optional[str], List[str]]:
+        """
+        Walk a parsed page once, collecting both the movie title (a match for
+        the earliest of TITLE_SELECTORS) and the non-empty text of every
+        button/link.
+        Button text is joined across child tags, so <a>Book <span>now</span></a>
+        reads as 'Book now'.
+        """
+        title = None
+        title_rank = len(self.TITLE_MATCHERS)
+        button_texts = []
+        for element in soup.find_all(True):
+            # Only selectors ranked above the current best can improve on it
+            for rank in range(title_rank):
+                if self.TITLE_MATCHERS[rank].match(element):
+                    title = element.get_text(strip=True)
+                    title_rank = rank
+                    break
+            if element.name in ('button', 'a'):
+                button_text = self._normalize_text(element.get_text(' ', strip=True))
+                if button_text:
+                    button_texts.append(button_text)
+        return title, button_texts
+    
+    def _get_client(self) -> aiohttp.ClientSession:
+        """
+        Return the shared aiohttp session, creating it on first use.
+        At most two connections are opened per host, so concurrent checks stay
+        polite to BookMyShow without serializing requests to other hosts.
+        DNS answers are cached and idle connections kept for ten minutes, so
+        checks a few minutes apart reuse the same TLS connection.
+        """
+        if self._client is None or self._client.closed:
+            self._client = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=10),
+                connector=aiohttp.TCPConnector(
+                    limit=20,
+                    limit_per_host=2,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=600
+                )
+            )
+        return self._client
+    
+    async def close(self) -> None:
+        """Close the shared HTTP session."""
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
     
-    def check_ticket_availability(self, url: str) -> Dict[str, any]:
+    async def check_ticket_availability(self, url: str, etag: Optional[str] = None,
+                                        last_modified: Optional[str] = None,
+                                        force: bool = False) -> Dict[str, any]:
         """
         Check if movie tickets are available for booking on the given URL.
         
         Args:
             url: BookMyShow movie page URL to check
+            etag: ETag from a previous check, sent as If-None-Match
+            last_modified: Last-Modified from a previous check, sent as If-Modified-Since
+            force: Skip the result cache and always fetch; the fresh result
+                is still cached for later callers
             
         Returns:
             Dictionary containing:
@@ -69,97 +233,236 @@ class BookMyShowScraper:
             - status: String status message
             - error: Error message if any
             - title: Movie title if found
+            - etag / last_modified: Validators to send with the next check
+            - not_modified: True if the server answered 304; the page is
+              unchanged and the other fields carry no new verdict
+            
+        Successful results are cached per URL for cache_ttl seconds, so
+        repeated checks within that window (e.g. a /test right after a
+        monitor tick) are answered without any HTTP request. The monitor
+        passes force=True, since its own schedule already decides when a URL
+        is due and a cached answer would look like an unchanged page.
         """
-        result = {
+        cached = None if force else self._cache.get(url)
+        if cached is not None:
+            return dict(cached)
+        
+        result = None
+        if self.api_url:
+            result = await self._fetch_availability_from_api(url, etag, last_modified)
+        if result is None:
+            result = await self._fetch_availability(url, etag, last_modified)
+        if not result['error'] and not result['not_modified']:
+            self._cache[url] = dict(result)
+        return result
+    
+    @classmethod
+    def _new_result(cls, url: str, etag: Optional[str] = None,
+                    last_modified: Optional[str] = None) -> Dict[str, any]:
+        """Return a result dict with default values for the given URL."""
+        return {
             'available': False,
             'status': 'Unknown',
             'error': None,
-            'title': 'Unknown Movie',
-            'url': url
+            'title': cls.UNKNOWN_TITLE,
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'not_modified': False
         }
+    
+    @classmethod
+    def _entry_bookable(cls, entry) -> Optional[bool]:
+        """
+        Whether a show/venue entry says it can be booked, or None if it has no
+        availability flag or status field.
+        """
+        if not isinstance(entry, dict):
+            return None
+        for key in cls.API_FLAG_KEYS:
+            if isinstance(entry.get(key), bool):
+                return entry[key]
+        for key in cls.API_STATUS_KEYS:
+            value = entry.get(key)
+            if isinstance(value, str):
+                status = ' '.join(value.replace('_', ' ').lower().split())
+                return status in cls.API_AVAILABLE_STATUSES
+        return None
+    
+    @classmethod
+    def _count_shows(cls, payload) -> Optional[Tuple[int, int]]:
+        """
+        Count the show/venue entries in a JSON payload (see API_SHOW_KEY_RE).
+        
+        Returns:
+            Tuple of entries that state their availability and entries that
+            are bookable, or None if the payload has no show/venue lists, or
+            only has entries without availability fields
+        """
+        found = False
+        checked = bookable = unknown = 0
+        stack = [payload]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    if cls.API_SKIP_KEY_RE.search(key):
+                        continue
+                    if isinstance(value, list) and cls.API_SHOW_KEY_RE.search(key):
+                        found = True
+                        for entry in value:
+                            entry_bookable = cls._entry_bookable(entry)
+                            if entry_bookable is None:
+                                unknown += 1
+                            else:
+                                checked += 1
+                                bookable += entry_bookable
+                    if isinstance(value, (dict, list)):
+                        stack.append(value)
+            elif isinstance(node, list):
+                stack.extend(item for item in node if isinstance(item, (dict, list)))
+        if not found or (unknown and not checked):
+            return None
+        return checked, bookable
+    
+    @classmethod
+    def _find_api_title(cls, payload) -> Optional[str]:
+        """Return the movie title from a JSON payload (see API_TITLE_KEYS), or None."""
+        if not isinstance(payload, dict):
+            return None
+        nodes = [payload] + [value for value in payload.values() if isinstance(value, dict)]
+        for node in nodes:
+            for key in cls.API_TITLE_KEYS:
+                title = node.get(key)
+                if isinstance(title, str) and title.strip():
+                    return title.strip()
+        return None
+    
+    async def _fetch_availability_from_api(self, url: str, etag: Optional[str],
+                                           last_modified: Optional[str]) -> Optional[Dict[str, any]]:
+        """
+        Check availability through the JSON endpoint instead of the HTML page.
+        The page validators are passed through unchanged, so the next HTML
+        fallback can still send a conditional GET.
+        
+        Returns:
+            Result dictionary, or None if the URL has no event code, the request
+            fails, or the payload carries no show/venue availability data (see
+            API_SHOW_KEY_RE), in which case the caller falls back to scraping
+            the HTML page
+        """
+        match = self.EVENT_CODE_RE.search(url)
+        if not match:
+            return None
+        
+        api_url = self.api_url.format(event_code=match.group(1))
+        try:
+            await self._rate_limit(api_url)
+            async with self._semaphore:
+                async with self._get_client().get(
+                    api_url, headers={'Accept': 'application/json'}
+                ) as response:
+                    response.raise_for_status()
+                    payload = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"API check failed for {url}, falling back to HTML: {e}")
+            return None
+        
+        counts = self._count_shows(payload)
+        if counts is None:
+            logger.info(f"API response for {url} has no show availability data, falling back to HTML")
+            return None
+        
+        result = self._new_result(url, etag, last_modified)
+        result['title'] = self._find_api_title(payload) or result['title']
+        checked, bookable = counts
+        if bookable:
+            result['available'] = True
+            result['status'] = f"Tickets available - {bookable} of {checked} shows/venues bookable"
+            logger.info(f"Tickets available for {url}: {bookable} of {checked} shows/venues bookable")
+        else:
+            result['status'] = "Not available - no bookable shows listed"
+            logger.info(f"Tickets not available for {url}: no bookable shows listed")
+        return result
+    
+    def _find_indicators(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        """Return the first booking and first unavailable indicator in text (or None)."""
+        found = {}
+        for match in self.INDICATOR_RE.finditer(text):
+            found.setdefault(match.lastgroup, match.group(0))
+            if len(found) == 2:
+                break
+        return found.get('available'), found.get('unavailable')
+    
+    async def _fetch_availability(self, url: str, etag: Optional[str],
+                                  last_modified: Optional[str]) -> Dict[str, any]:
+        """Fetch and classify a movie page; see check_ticket_availability."""
+        result = self._new_result(url, etag, last_modified)
+        
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
         
         try:
-            # Apply rate limiting
-            self._rate_limit()
-            
             logger.info(f"Checking ticket availability for: {url}")
             
             # Make request to the movie page
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            
-            # Handle encoding properly for compressed content
-            response.encoding = 'utf-8'
-            
-            # Parse HTML content with proper encoding
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Try to extract movie title
-            title_selectors = [
-                'h1[data-testid="movie-title"]',
-                'h1.movie-title',
-                '.movie-name h1',
-                'h1',
-                '.title'
-            ]
-            
-            for selector in title_selectors:
-                title_element = soup.select_one(selector)
-                if title_element:
-                    result['title'] = title_element.get_text(strip=True)
-                    break
+            await self._rate_limit(url)
+            async with self._semaphore:
+                async with self._get_client().get(url, headers=headers) as response:
+                    if response.status == 304:
+                        result['not_modified'] = True
+                        result['status'] = "Page not modified since last check"
+                        logger.info(f"Page not modified for {url}")
+                        return result
+                    response.raise_for_status()
+                    result['etag'] = response.headers.get('ETag')
+                    result['last_modified'] = response.headers.get('Last-Modified')
+                    html = await response.text(errors='replace')
             
-            # Look for booking availability indicators
-            booking_indicators = [
-                'Book tickets',
-                'Book now',
-                'Buy tickets',
-                'Purchase tickets',
-                'Select seats',
-                'Choose seats'
-            ]
-            
-            page_text = soup.get_text().lower()
-            
-            # Check for booking button or text
-            for indicator in booking_indicators:
-                if indicator.lower() in page_text:
-                    result['available'] = True
-                    result['status'] = f"Tickets available - found '{indicator}'"
-                    logger.info(f"Tickets available for {result['title']}: {indicator}")
-                    return result
+            # A raw hit may sit in a <meta> tag, an attribute or a script, so
+            # confirm it against the text a visitor would see
+            if self.INDICATOR_RE.search(html):
+                soup = BeautifulSoup(html, 'lxml')
+                for element in soup(self.HIDDEN_TAGS):
+                    element.decompose()
+                page_text = self._normalize_text(soup.get_text(' '))
+                available_indicator, unavailable_indicator = self._find_indicators(page_text)
+            else:
+                soup = BeautifulSoup(html, 'lxml', parse_only=self.STRAINER)
+                available_indicator = unavailable_indicator = None
+            
+            title, button_texts = self._scan_elements(soup)
+            result['title'] = title or result['title']
+            
+            # Check for booking text on the page
+            if available_indicator:
+                result['available'] = True
+                result['status'] = f"Tickets available - found '{available_indicator}'"
+                logger.info(f"Tickets available for {result['title']}: {available_indicator}")
+                return result
             
             # Check for specific button elements
-            booking_buttons = soup.find_all(['button', 'a'])
-            for button in booking_buttons:
-                button_text = button.get_text(strip=True) if button else ''
-                if button_text and any(indicator.lower() in button_text.lower() for indicator in booking_indicators):
+            for button_text in button_texts:
+                if self.BOOKING_RE.search(button_text):
                     result['available'] = True
                     result['status'] = f"Booking button found: {button_text}"
                     logger.info(f"Booking button found for {result['title']}: {button_text}")
                     return result
             
-            
             # Check for sold out or unavailable indicators
-            unavailable_indicators = [
-                'sold out',
-                'not available',
-                'coming soon',
-                'advance booking not started',
-                'no shows available'
-            ]
-            
-            for indicator in unavailable_indicators:
-                if indicator.lower() in page_text:
-                    result['status'] = f"Not available - {indicator}"
-                    logger.info(f"Tickets not available for {result['title']}: {indicator}")
-                    return result
+            if unavailable_indicator:
+                result['status'] = f"Not available - {unavailable_indicator}"
+                logger.info(f"Tickets not available for {result['title']}: {unavailable_indicator}")
+                return result
             
             # Default case - no clear indicators found
             result['status'] = "No clear booking indicators found"
             logger.info(f"No clear booking status for {result['title']}")
             
-        except requests.exceptions.RequestException as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             error_msg = f"Request error: {str(e)}"
             result['error'] = error_msg
             result['status'] = "Request failed"
@@ -173,7 +476,29 @@ class BookMyShowScraper:
         
         return result
     
-    def get_movie_info(self, url: str) -> Optional[Dict[str, str]]:
+    @staticmethod
+    def _text_selector(content: bytes) -> Callable[[str], Optional[str]]:
+        """
+        Parse a full page and return a function mapping a CSS selector to the
+        stripped text of its first match (or None). Uses selectolax's Lexbor
+        parser when installed, falling back to BeautifulSoup with lxml.
+        """
+        if HTMLParser is not None:
+            tree = HTMLParser(content)
+            
+            def select_text(selector: str) -> Optional[str]:
+                node = tree.css_first(selector)
+                return node.text(strip=True) if node else None
+        else:
+            soup = BeautifulSoup(content, 'lxml')
+            
+            def select_text(selector: str) -> Optional[str]:
+                element = soup.select_one(selector)
+                return element.get_text(strip=True) if element else None
+        
+        return select_text
+    
+    async def get_movie_info(self, url: str) -> Optional[Dict[str, str]]:
         """
         Extract basic movie information from BookMyShow page.
         
@@ -184,29 +509,30 @@ class BookMyShowScraper:
             Dictionary with movie information or None if failed
         """
         try:
-            self._rate_limit()
-            
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
+            await self._rate_limit(url)
+            async with self._semaphore:
+                async with self._get_client().get(url) as response:
+                    response.raise_for_status()
+                    content = await response.read()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            select_text = self._text_selector(content)
             
             info = {}
             
             # Extract title
-            title_element = soup.select_one('h1[data-testid="movie-title"], h1.movie-title, h1')
-            if title_element:
-                info['title'] = title_element.get_text(strip=True)
+            title = select_text('h1[data-testid="movie-title"], h1.movie-title, h1')
+            if title:
+                info['title'] = title
             
             # Extract genre
-            genre_element = soup.select_one('.genre, .movie-genre')
-            if genre_element:
-                info['genre'] = genre_element.get_text(strip=True)
+            genre = select_text('.genre, .movie-genre')
+            if genre:
+                info['genre'] = genre
             
             # Extract rating
-            rating_element = soup.select_one('.rating, .movie-rating')
-            if rating_element:
-                info['rating'] = rating_element.get_text(strip=True)
+            rating = select_text('.rating, .movie-rating')
+            if rating:
+                info['rating'] = rating
             
             logger.info(f"Extracted movie info: {info}")
             return info